@@ -1,8 +1,16 @@
 import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from src.bots.review_bot import ReviewBot
 from src.bots.fix_bot import FixBot
 
 
+@functools.lru_cache(maxsize=None)
+def _get_bot(bot_name: str):
+    """Reuse one bot instance per type so clients and sessions persist across triggers"""
+    return {"review": ReviewBot, "fix": FixBot}[bot_name]()
+
+
 async def trigger_bot(
     bot_name: str,
     instruction: str,
@@ -25,7 +33,7 @@ async def trigger_bot(
     """
     try:
         if bot_name.lower() == "review":
-            bot = ReviewBot()
+            bot = _get_bot("review")
             if repo_name and pr_number:
                 result = await bot.review_pr(
                     repo_name,
@@ -38,7 +46,7 @@ async def trigger_bot(
                 result = {"error": "ReviewBot requires repo_name and pr_number"}
 
         elif bot_name.lower() == "fix":
-            bot = FixBot()
+            bot = _get_bot("fix")
             if repo_name and pr_number:
                 # Get existing review comments and apply custom instruction
                 result = await bot.fix_code(
@@ -71,11 +79,19 @@ def run_bot(
     comment_type: str = "issue_comment",
 ):
     """Synchronous wrapper for trigger_bot"""
-    return asyncio.run(
-        trigger_bot(
-            bot_name, instruction, repo_name, pr_number, comment_id, comment_type
-        )
+    coro = trigger_bot(
+        bot_name, instruction, repo_name, pr_number, comment_id, comment_type
     )
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    # Called from a thread that is already running an event loop: blocking
+    # that thread on its own loop would deadlock, so run the coroutine on a
+    # fresh loop in a worker thread (async hosts should prefer awaiting
+    # trigger_bot directly)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
 
 
 if __name__ == "__main__":
@@ -1,18 +1,252 @@
 import os
-import requests
 import re
 import json
-from github import Github, Auth
+import logging
+import asyncio
+import itertools
+import bisect
+import random
+import weakref
+import functools
+import threading
+import aiohttp
 from dotenv import load_dotenv
 
+try:
+    from src.utils import falcon_cache
+    from src.utils.github_client import shared_github
+except ImportError:
+    # code_review_system puts src/ itself on sys.path
+    from utils import falcon_cache
+    from utils.github_client import shared_github
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj):
+        return json.dumps(obj).encode()
+
+# Parse .env once at import; instances just read the populated os.environ
+load_dotenv()
+
+MODEL_NAME = "anthropic.claude-3-5-sonnet-20241022-v2:0"
+
+# One alternation scans the comment in a single pass; group names encode the
+# old four-pattern precedence (tagged > colon > backticked > bare)
+# Filename shape: dot-free stem segments with explicit separators and a
+# bounded extension, so the engine cannot backtrack quadratically on long
+# dotted runs in adversarial comment bodies
+_FN = r"(?<![a-zA-Z0-9_./-])[a-zA-Z0-9_/-]+(?:\.[a-zA-Z0-9_/-]+)*\.[a-zA-Z0-9]{1,8}"
+_FILENAME_RE = re.compile(
+    rf"🤖 (?P<tagged>{_FN}):"
+    rf"|(?P<colon>{_FN}):"
+    rf"|`(?P<ticked>{_FN})`"
+    rf"|(?P<bare>{_FN})"
+)
+_FILENAME_PRECEDENCE = ("tagged", "colon", "ticked", "bare")
+# Synthetic reviews and ReviewBot comments start with "🤖 <file>:", so an
+# anchored match usually resolves without scanning the whole body
+_TAGGED_FILENAME_RE = re.compile(rf"🤖 ({_FN}):")
+
+# Files worth sending to the fix path; tuple form keeps endswith in C
+_CODE_EXTS = (".py", ".js", ".ts", ".java", ".cpp", ".go")
+
+# Upper bound on patch text embedded in a Falcon prompt; latency and token
+# cost scale with input size and the review comment already localizes the issue
+_MAX_PROMPT_PATCH = 4000
+
+# Suggestion body assembled once as a template instead of per-fix f-strings
+_BODY_TMPL = """🔧 **FixBot Suggestion #{num}** {emoji}
+
+```suggestion
+{code}
+```
+
+**Confidence:** {pct:.0%} | **Issue:** {issue}
+
+{guidance}"""
+
+# Emoji and guidance picked by bisecting confidence against sorted thresholds
+_GUIDANCE_THRESHOLDS = (0.7, 0.8, 0.9)
+_CONF_EMOJI = ("🔴", "🟡", "🟡", "🟢")
+_GUIDANCE = (
+    "⚠️ **Low confidence** - Please review carefully before applying",
+    "🔍 **Manual review required** - Moderate confidence, check carefully",
+    "⚠️ **Review suggested** - Good confidence, please verify",
+    "✅ **Recommended** - High confidence, safe to apply",
+)
+
+# Case-insensitive single-scan classifiers; no lowercased copy of the text
+_QUESTION_START_RE = re.compile(
+    r"^(?:why|what|how|should|do you|can you explain|is this)", re.IGNORECASE
+)
+_FIX_VERB_RE = re.compile(
+    r"\b(?:fix|add|remove|delete|change|update|implement|refactor)\b", re.IGNORECASE
+)
+_HUNK_RE = re.compile(r"@@\s*-\d+,?\d*\s*\+?(\d+)")
+
+# Static skeleton of every Falcon request body; only the prompt varies, so
+# serialization per call is one string encode instead of a full dict dump
+_BODY_PREFIX = (
+    b'{"model":"' + MODEL_NAME.encode() + b'","stream":true,'
+    b'"messages":[{"role":"user","content":'
+)
+_BODY_SUFFIX = b"}]}"
+_HUNK_HEADER_RE = re.compile(r"@@\s*-\d+,?\d*\s*\+(\d+),?(\d*)")
+_LINE_REF_RE = re.compile(r"line\s+(\d+)", re.IGNORECASE)
+_MD_FENCE_RE = re.compile(r"```(?:json)?\s*([\s\S]*?)```")
+
+
+def _extract_json_span(text: str, opener: str, closer: str) -> str:
+    """Return the first balanced opener...closer span, or None
+
+    Linear depth scan; the old (\[.*\]) DOTALL regex walked the string
+    quadratically when no closing bracket existed.
+    """
+    start = text.find(opener)
+    if start < 0:
+        return None
+    depth = 0
+    for i in range(start, len(text)):
+        c = text[i]
+        if c == opener:
+            depth += 1
+        elif c == closer:
+            depth -= 1
+            if depth == 0:
+                return text[start : i + 1]
+    return None
+
+
+def _extract_json_array(text: str) -> str:
+    return _extract_json_span(text, "[", "]")
+
+
+def _relevant_hunks(patch: str, review_comment: str) -> str:
+    """Prune a patch to the hunks the review comment actually refers to
+
+    Large patches inflate Falcon token counts and latency. When the review
+    mentions specific line numbers, only hunks whose new-file range covers one
+    of them are kept (falling back to the first hunk if none match). Without
+    line references the patch is left as-is.
+    """
+    mentioned = {int(n) for n in _LINE_REF_RE.findall(review_comment)}
+    if not mentioned:
+        return patch
+
+    hunks = []
+    for i, part in enumerate(patch.split("\n@@")):
+        hunks.append(part if i == 0 else "@@" + part)
+    if len(hunks) <= 1:
+        return patch
+
+    kept = []
+    for hunk in hunks:
+        header = _HUNK_HEADER_RE.match(hunk)
+        if not header:
+            continue
+        start = int(header.group(1))
+        count = int(header.group(2) or 1)
+        if any(start <= line < start + count for line in mentioned):
+            kept.append(hunk)
+    return "\n".join(kept) if kept else hunks[0]
+
+
+@functools.lru_cache(maxsize=256)
+def _valid_patch_lines(patch: str) -> frozenset:
+    """New-file line numbers covered by the patch's hunks
+
+    GitHub rejects review comments on lines outside the diff, and one bad
+    line 422s the whole batched review POST.
+    """
+    lines = set()
+    for header in _HUNK_HEADER_RE.finditer(patch):
+        start = int(header.group(1))
+        count = int(header.group(2) or 1)
+        lines.update(range(start, start + count))
+    return frozenset(lines)
+
+
+@functools.lru_cache(maxsize=256)
+def _get_line_from_patch(patch: str) -> int:
+    """Extract line number from patch (cached; patches repeat across comments)"""
+    # The hunk header is the first line of a GitHub patch, so plain string
+    # slicing beats running the regex over the whole body
+    head = patch.split("\n", 1)[0]
+    if head.startswith("@@"):
+        plus = head.find("+")
+        if plus > 0:
+            end = plus + 1
+            while end < len(head) and head[end].isdigit():
+                end += 1
+            if end > plus + 1:
+                return int(head[plus + 1 : end])
+    match = _HUNK_RE.search(patch)
+    return int(match.group(1)) if match else 1
+
 
 class FixBot:
     def __init__(self):
-        load_dotenv()
-        auth = Auth.Token(os.getenv("GITHUB_TOKEN"))
-        self.github = Github(auth=auth)
+        # One client per process: shared connection pool and rate-limit view
+        self.github = shared_github()
         self.falcon_api_key = os.getenv("FALCON_API_KEY")
         self.base_url = "https://falconai.planview-prod.io"
+        # The session and semaphores are loop-bound, but the instance is
+        # cached across triggers (bot_trigger._get_bot) and concurrent
+        # run_bot calls drive it from different loops — so loop-bound
+        # state lives in a per-loop map, and entries die with their loop
+        self._loop_states = weakref.WeakKeyDictionary()
+        self._state_lock = threading.Lock()
+
+    def _loop_state(self) -> dict:
+        """Session and semaphores for the current running loop"""
+        loop = asyncio.get_running_loop()
+        with self._state_lock:
+            state = self._loop_states.get(loop)
+            if state is None:
+                # Bound in-flight requests so a large gather fan-out cannot
+                # thrash Falcon or GitHub rate limits
+                state = {
+                    "session": None,
+                    "falcon_sem": asyncio.Semaphore(8),
+                    "gh_sem": asyncio.Semaphore(20),
+                }
+                self._loop_states[loop] = state
+        return state
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Lazily create this loop's aiohttp session (must be called from a running loop)"""
+        state = self._loop_state()
+        if state["session"] is None or state["session"].closed:
+            state["session"] = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=20, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=90),
+            )
+        return state["session"]
+
+    async def close(self):
+        """Close the current loop's HTTP session"""
+        state = self._loop_states.get(asyncio.get_running_loop())
+        if state and state["session"] and not state["session"].closed:
+            await state["session"].close()
+
+    async def _fetch_files_by_name(self, pr) -> dict:
+        """One paginated files fetch, keyed by filename for patch lookups"""
+        return await asyncio.to_thread(
+            lambda: {f.filename: f.patch for f in pr.get_files()}
+        )
+
+    async def _gh_call(self, fn, *args):
+        """Run a blocking PyGithub call off-loop, capped by the GitHub semaphore"""
+        async with self._loop_state()["gh_sem"]:
+            return await asyncio.to_thread(fn, *args)
 
     async def fix_code(
         self,
@@ -25,8 +259,10 @@ class FixBot:
     ):
         """Generate AI-powered fixes as GitHub suggested changes"""
         try:
-            repo = self.github.get_repo(repo_name)
-            pr = repo.get_pull(pr_number)
+            # lazy=True skips the repo-metadata round-trip; the PR fetch is
+            # the only REST call needed before routing
+            repo = self.github.get_repo(repo_name, lazy=True)
+            pr = await asyncio.to_thread(repo.get_pull, pr_number)
             fixes_applied = []
 
             # If there's a custom instruction and comment_id, decide whether to fix or answer
@@ -34,14 +270,21 @@ class FixBot:
                 should_fix = await self._should_provide_fix(custom_instruction)
                 
                 if should_fix:
+                    files_by_name = await self._fetch_files_by_name(pr)
                     # Treat as fix request - analyze PR for fixes
                     fix_result = await self._analyze_pr_for_fixes(
-                        repo, pr, custom_instruction, custom_instruction, comment_id, comment_type
+                        repo,
+                        pr,
+                        custom_instruction,
+                        files_by_name,
+                        custom_instruction,
+                        comment_id,
+                        comment_type,
                     )
                     # Also post inline reply acknowledging the fix request
-                    self._post_comment(
-                        repo_name,
-                        pr_number,
+                    await self._gh_call(
+                        self._post_comment,
+                        pr,
                         f"🔧 **FixBot:** Working on your request: '{custom_instruction}' - Check the code suggestions above!",
                         comment_id,
                         comment_type,
@@ -50,44 +293,45 @@ class FixBot:
                 else:
                     # Treat as question - provide answer
                     response = await self._answer_question(pr, custom_instruction, comment_id)
-                    self._post_comment(
-                        repo_name,
-                        pr_number,
+                    await self._gh_call(
+                        self._post_comment,
+                        pr,
                         f"🤖 **FixBot:**\n{response}",
                         comment_id,
                         comment_type,
                     )
                     return [f"Direct response: {response}"]
 
-            # Otherwise, process review comments for fixes
-            for comment in review_comments:
-                if isinstance(comment, str):
-                    if "🤖" in comment and "AI Summary:" not in comment:
-                        fix_result = await self._create_suggested_fix(
-                            repo,
-                            pr,
-                            comment,
-                            custom_instruction,
-                            comment_id,
-                            comment_type,
-                        )
-                    else:
-                        fix_result = await self._analyze_pr_for_fixes(
-                            repo,
-                            pr,
-                            comment,
-                            custom_instruction,
-                            comment_id,
-                            comment_type,
-                        )
-
-                    if fix_result and "Created" in fix_result:
-                        fixes_applied.append(fix_result)
+            # Fetch the file list once per PR; helpers look patches up here
+            # instead of re-paginating pr.get_files() per comment. Deferred
+            # to this point so the question path never pays for it
+            files_by_name = await self._fetch_files_by_name(pr)
+
+            # Otherwise, process review comments for fixes concurrently
+            tasks = [
+                self._process_comment(
+                    repo,
+                    pr,
+                    comment,
+                    files_by_name,
+                    custom_instruction,
+                    comment_id,
+                    comment_type,
+                )
+                for comment in review_comments
+                if isinstance(comment, str)
+            ]
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            for fix_result in results:
+                if isinstance(fix_result, Exception):
+                    logger.warning("Comment processing failed: %s", fix_result)
+                elif fix_result and "Created" in fix_result:
+                    fixes_applied.append(fix_result)
 
             if not fixes_applied:
-                self._post_comment(
-                    repo_name,
-                    pr_number,
+                await self._gh_call(
+                    self._post_comment,
+                    pr,
                     "🤖 **FixBot** ✅\n\nCode looks good! No issues found that require fixes.",
                     comment_id,
                     comment_type,
@@ -98,11 +342,31 @@ class FixBot:
         except Exception as e:
             return [f"Error creating fixes: {str(e)}"]
 
+    async def _process_comment(
+        self,
+        repo,
+        pr,
+        comment: str,
+        files_by_name: dict,
+        custom_instruction: str = None,
+        comment_id: int = None,
+        comment_type: str = "issue_comment",
+    ):
+        """Process a single review comment, routing to per-file fix or PR-wide analysis"""
+        if "🤖" in comment and "AI Summary:" not in comment:
+            return await self._create_suggested_fix(
+                repo, pr, comment, files_by_name, custom_instruction, comment_id, comment_type
+            )
+        return await self._analyze_pr_for_fixes(
+            repo, pr, comment, files_by_name, custom_instruction, comment_id, comment_type
+        )
+
     async def _create_suggested_fix(
         self,
         repo,
         pr,
         review_comment,
+        files_by_name: dict,
         custom_instruction: str = None,
         comment_id: int = None,
         comment_type: str = "issue_comment",
@@ -113,21 +377,25 @@ class FixBot:
             if not filename:
                 return "Could not identify file to fix"
 
-            file_patch = self._get_file_patch(pr, filename)
+            file_patch = files_by_name.get(filename)
             if not file_patch:
                 return f"Could not find changes for {filename}"
 
             fixes = await self._generate_partial_fixes(
                 review_comment, file_patch, custom_instruction
             )
-            suggestions_created = self._create_suggestions(
-                pr, fixes, filename, file_patch
+            suggestions_created = await self._gh_call(
+                self._create_suggestions, pr, fixes, filename, file_patch
             )
 
             if suggestions_created > 0:
                 summary_text = f"🤖 **FixBot Analysis for {filename}**\n\n✅ Created {suggestions_created} suggestions"
-                self._post_comment(
-                    repo.name, pr.number, summary_text, comment_id, comment_type
+                await self._gh_call(
+                    self._post_comment,
+                    pr,
+                    summary_text,
+                    comment_id,
+                    comment_type,
                 )
 
             return f"Created {suggestions_created} suggestions for {filename}"
@@ -136,133 +404,176 @@ class FixBot:
 
     def _extract_filename(self, review_comment: str) -> str:
         """Extract filename from review comment"""
-        patterns = [
-            r"🤖 ([a-zA-Z0-9_/.-]+\.[a-zA-Z0-9]+):",
-            r"([a-zA-Z0-9_/.-]+\.[a-zA-Z0-9]+):",
-            r"`([a-zA-Z0-9_/.-]+\.[a-zA-Z0-9]+)`",
-            r"([a-zA-Z0-9_/.-]+\.[a-zA-Z0-9]+)",
-        ]
-
-        for pattern in patterns:
-            matches = re.findall(pattern, review_comment)
-            if matches:
-                return matches[0]
-        return None
-
-    def _get_file_patch(self, pr, filename: str) -> str:
-        """Get patch for specific file"""
-        for f in pr.get_files():
-            if f.filename == filename:
-                return f.patch
+        anchored = _TAGGED_FILENAME_RE.match(review_comment)
+        if anchored:
+            return anchored.group(1)
+
+        found = {}
+        for match in _FILENAME_RE.finditer(review_comment):
+            group = match.lastgroup
+            if group not in found:
+                found[group] = match.group(group)
+                if group == "tagged":
+                    break
+        for group in _FILENAME_PRECEDENCE:
+            if group in found:
+                return found[group]
         return None
 
     def _create_suggestions(
         self, pr, fixes: list, filename: str, file_patch: str
     ) -> int:
-        """Create GitHub suggestions for all fixes"""
-        suggestions_created = 0
-
-        print(f"DEBUG: Processing {len(fixes)} fixes for {filename}")
+        """Create GitHub suggestions for all fixes as one batched review"""
+        logger.debug("Processing %d fixes for %s", len(fixes), filename)
+        # Invariant across the loop: parse the patch's default line once
+        default_line = _get_line_from_patch(file_patch)
+        valid_lines = _valid_patch_lines(file_patch)
+        review_comments = []
         for i, fix in enumerate(fixes):
-            print(
-                f"DEBUG: Fix {i+1} - Confidence: {fix['confidence']}, Issue: {fix['issue']}"
-            )
-
-            confidence_emoji = (
-                "🟢"
-                if fix["confidence"] >= 0.9
-                else "🟡" if fix["confidence"] >= 0.7 else "🔴"
+            logger.debug(
+                "Fix %d - Confidence: %s, Issue: %s", i + 1, fix["confidence"], fix["issue"]
             )
-            guidance = self._get_guidance(fix["confidence"])
 
-            try:
-                pr.create_review_comment(
-                    body=f"""🔧 **FixBot Suggestion #{i+1}** {confidence_emoji}
+            band = bisect.bisect_right(_GUIDANCE_THRESHOLDS, fix["confidence"])
+            confidence_emoji = _CONF_EMOJI[band]
+            guidance = _GUIDANCE[band]
 
-```suggestion
-{fix['code']}
-```
-
-**Confidence:** {fix['confidence']:.0%} | **Issue:** {fix['issue']}
+            review_comments.append(
+                {
+                    "path": filename,
+                    "line": (
+                        fix["line"] if fix.get("line") in valid_lines else default_line
+                    ),
+                    "body": _BODY_TMPL.format(
+                        num=i + 1,
+                        emoji=confidence_emoji,
+                        code=fix["code"],
+                        pct=fix["confidence"],
+                        issue=fix["issue"],
+                        guidance=guidance,
+                    ),
+                }
+            )
 
-{guidance}""",
-                    commit=pr.head.sha,
-                    path=filename,
-                    line=fix.get("line", self._get_line_from_patch(file_patch)),
-                )
-                suggestions_created += 1
-                print(f"DEBUG: Successfully created suggestion {i+1}")
-            except Exception as e:
-                print(f"DEBUG: Failed to create suggestion {i+1}: {str(e)}")
+        if not review_comments:
+            return 0
 
-        return suggestions_created
+        try:
+            # One review POST carries every suggestion: 1 round-trip and 1
+            # notification instead of N create_review_comment calls. No
+            # commit kwarg — PyGithub 2.x wants a Commit object there and
+            # the API defaults to the PR's latest commit anyway
+            pr.create_review(
+                body="",
+                event="COMMENT",
+                comments=review_comments,
+            )
+            logger.debug("Created batched review with %d suggestions", len(review_comments))
+            return len(review_comments)
+        except Exception as e:
+            logger.warning("Failed to create batched review: %s", e)
+            return 0
 
     def _get_guidance(self, confidence: float) -> str:
         """Get acceptance guidance based on confidence"""
-        if confidence >= 0.9:
-            return "✅ **Recommended** - High confidence, safe to apply"
-        elif confidence >= 0.8:
-            return "⚠️ **Review suggested** - Good confidence, please verify"
-        elif confidence >= 0.7:
-            return (
-                "🔍 **Manual review required** - Moderate confidence, check carefully"
-            )
-        else:
-            return "⚠️ **Low confidence** - Please review carefully before applying"
+        return _GUIDANCE[bisect.bisect_right(_GUIDANCE_THRESHOLDS, confidence)]
 
     def _post_comment(
         self,
-        repo_name: str,
-        pr_number: int,
+        pr,
         text: str,
         comment_id: int = None,
         comment_type: str = "issue_comment",
     ):
         """Post comment as reply or new comment"""
         try:
-            repo = self.github.get_repo(repo_name)
-            pr = repo.get_pull(pr_number)
-
             if comment_id and comment_type == "review_comment":
                 try:
                     pr.create_review_comment_reply(comment_id, text)
                 except Exception as e:
-                    print(f"Failed to reply to review comment: {str(e)}")
+                    logger.warning("Failed to reply to review comment: %s", e)
                     pr.create_issue_comment(text)
             else:
                 pr.create_issue_comment(text)
         except Exception as e:
-            print(f"Error posting comment: {str(e)}")
-
-    def _call_falcon_ai(self, prompt: str) -> str:
-        """Make API call to Falcon AI"""
-        try:
-            response = requests.post(
-                f"{self.base_url}/api/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {self.falcon_api_key}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": "anthropic.claude-3-5-sonnet-20241022-v2:0",
-                    "messages": [{"role": "user", "content": prompt}],
-                },
-                timeout=90,
-            )
-
-            if response.status_code == 200:
-                result = response.json()
-                if "choices" in result and result["choices"]:
-                    return result["choices"][0]["message"]["content"].strip()
-
-            return f"API error {response.status_code}"
-        except Exception as e:
-            return f"Falcon AI failed: {str(e)}"
+            logger.error("Error posting comment: %s", e)
+
+    async def _call_falcon_ai(self, prompt: str) -> str:
+        """Make async API call to Falcon AI without blocking the event loop"""
+        cached = falcon_cache.get(MODEL_NAME, prompt)
+        if cached is not None:
+            return cached
+
+        last_error = "Falcon AI failed: no attempt made"
+        retry_after = None
+        for attempt in range(2):
+            if attempt:
+                # Honor the server's Retry-After when present (capped), else
+                # fall back to a jittered backoff before the single retry
+                try:
+                    delay = min(float(retry_after), 30.0)
+                except (TypeError, ValueError):
+                    delay = random.uniform(0.5, 2.0)
+                await asyncio.sleep(delay)
+            try:
+                session = self._get_session()
+                async with self._loop_state()["falcon_sem"], session.post(
+                    f"{self.base_url}/api/chat/completions",
+                    headers={
+                        "Authorization": f"Bearer {self.falcon_api_key}",
+                        "Content-Type": "application/json",
+                    },
+                    data=_BODY_PREFIX + _json_dumps(prompt) + _BODY_SUFFIX,
+                ) as response:
+                    if response.status == 429 or response.status >= 500:
+                        retry_after = response.headers.get("Retry-After")
+                        last_error = f"API error {response.status}"
+                        continue
+                    if response.status != 200:
+                        # 4xx will not improve on retry
+                        return f"API error {response.status}"
+
+                    # Fall back to a buffered read if the server ignored stream=True
+                    if "text/event-stream" not in response.headers.get("Content-Type", ""):
+                        result = _json_loads(await response.read())
+                        if "choices" in result and result["choices"]:
+                            content = result["choices"][0]["message"]["content"].strip()
+                            falcon_cache.put(MODEL_NAME, prompt, content)
+                            return content
+                        return f"Unexpected response format: {str(result)[:300]}"
+
+                    # Accumulate SSE deltas as they arrive instead of buffering
+                    # the full completion body
+                    chunks = []
+                    async for raw in response.content:
+                        line = raw.decode("utf-8", "ignore").strip()
+                        if not line.startswith("data:"):
+                            continue
+                        payload = line[5:].strip()
+                        if payload == "[DONE]":
+                            break
+                        try:
+                            delta = _json_loads(payload)["choices"][0]["delta"]
+                            chunks.append(delta.get("content") or "")
+                        except (KeyError, IndexError, ValueError):
+                            continue
+
+                    content = "".join(chunks).strip()
+                    if content:
+                        falcon_cache.put(MODEL_NAME, prompt, content)
+                        return content
+                    return "API error: empty streamed response"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = f"Falcon AI failed: {str(e)}"
+            except Exception as e:
+                return f"Falcon AI failed: {str(e)}"
+        return last_error
 
     async def _generate_partial_fixes(
         self, review_comment: str, file_patch: str, custom_instruction: str = None
     ) -> list:
         """Generate multiple targeted fixes with confidence scores"""
+        file_patch = _relevant_hunks(file_patch, review_comment)[:_MAX_PROMPT_PATCH]
         prompt = f"""Analyze this code review and create targeted fixes:
 
 Review: {review_comment}
@@ -281,43 +592,31 @@ IMPORTANT:
             prompt += f"\n\nAdditional instruction: {custom_instruction}"
 
         try:
-            response = self._call_falcon_ai(prompt)
-            print(f"DEBUG: AI Response: {response[:200]}...")
+            response = await self._call_falcon_ai(prompt)
+            logger.debug("AI response: %.200s...", response)
 
-            # Clean up the response to extract JSON
             json_str = response.strip()
-            
-            # Remove markdown code blocks if present
-            json_match = re.search(r"```(?:json)?\s*([\s\S]*?)```", json_str)
-            if json_match:
-                json_str = json_match.group(1).strip()
-            
-            # Find JSON array in the response
-            array_match = re.search(r"(\[.*\])", json_str, re.DOTALL)
-            if array_match:
-                json_str = array_match.group(1)
-
-            fixes = json.loads(json_str)
-            print(f"DEBUG: Parsed {len(fixes)} fixes from AI")
-
-            valid_fixes = []
-            for fix in fixes:
-                if isinstance(fix, dict) and "code" in fix and "confidence" in fix:
-                    valid_fixes.append(
-                        {
-                            "issue": fix.get("issue", "Code improvement"),
-                            "code": fix["code"].strip(),
-                            "confidence": min(max(fix["confidence"], 0.0), 1.0),
-                            "line": fix.get("line"),
-                        }
-                    )
-
-            # Sort by confidence (highest first) and limit to top 3
-            valid_fixes.sort(key=lambda x: x['confidence'], reverse=True)
-            print(f"DEBUG: Created {len(valid_fixes)} valid fixes, returning top 3")
-            return valid_fixes[:3]
+            try:
+                # Fast path: the model usually returns the bare JSON array
+                fixes = _json_loads(json_str)
+            except ValueError:
+                # Fall back to stripping markdown fences and surrounding prose
+                json_match = _MD_FENCE_RE.search(json_str)
+                if json_match:
+                    json_str = json_match.group(1).strip()
+
+                array = _extract_json_array(json_str)
+                if array:
+                    json_str = array
+
+                fixes = _json_loads(json_str)
+            logger.debug("Parsed %d fixes from AI", len(fixes))
+
+            valid_fixes = self._validate_fixes(fixes)
+            logger.debug("Created %d valid fixes, returning top 3", len(valid_fixes))
+            return valid_fixes
         except Exception as e:
-            print(f"DEBUG: Exception in _generate_partial_fixes: {str(e)}")
+            logger.warning("Exception in _generate_partial_fixes: %s", e)
             return [
                 {
                     "issue": "Code improvement",
@@ -326,31 +625,130 @@ IMPORTANT:
                 }
             ]
 
+    def _validate_fixes(self, fixes: list) -> list:
+        """Normalize AI fix dicts, keeping the top 3 by confidence"""
+        valid_fixes = []
+        for fix in fixes:
+            if isinstance(fix, dict) and "code" in fix and "confidence" in fix:
+                valid_fixes.append(
+                    {
+                        "issue": fix.get("issue", "Code improvement"),
+                        "code": fix["code"].strip(),
+                        "confidence": min(max(fix["confidence"], 0.0), 1.0),
+                        "line": fix.get("line"),
+                    }
+                )
+
+        # Sort by confidence (highest first) and limit to top 3
+        valid_fixes.sort(key=lambda x: x["confidence"], reverse=True)
+        return valid_fixes[:3]
+
+    async def _generate_fixes_for_pr(
+        self, code_files: list, instruction: str, custom_instruction: str = None
+    ) -> dict:
+        """Generate fixes for every file with a single Falcon call
+
+        Returns {filename: [fix dicts]} or None when the batched response
+        cannot be parsed (callers fall back to per-file prompts).
+        """
+        if not code_files:
+            # Nothing to prompt about (docs-only PR); {} rather than None so
+            # the caller doesn't try the per-file fallback either
+            return {}
+        sections = "\n".join(
+            f"--- {filename} ---\n{patch[:_MAX_PROMPT_PATCH]}"
+            for filename, patch in code_files
+        )
+        prompt = f"""Analyze these code diffs and create targeted fixes for each file:
+
+Instruction: {instruction}
+
+{sections}
+
+Provide ONLY a valid JSON object mapping each filename to an array of fixes:
+{{"path/to/file.py": [{{"issue": "Brief description", "code": "Fixed code lines", "confidence": 0.95, "line": 10}}]}}
+
+IMPORTANT:
+- Return ONLY the JSON object, no other text
+- Do NOT use backticks or markdown in the "code" field
+- Omit files that need no fixes
+- Confidence: 0.0-1.0 scale"""
+
+        if custom_instruction:
+            prompt += f"\n\nAdditional instruction: {custom_instruction}"
+
+        response = await self._call_falcon_ai(prompt)
+        json_str = response.strip()
+        try:
+            fixes_by_file = _json_loads(json_str)
+        except ValueError:
+            json_match = _MD_FENCE_RE.search(json_str)
+            if json_match:
+                json_str = json_match.group(1).strip()
+            obj = _extract_json_span(json_str, "{", "}")
+            if obj is None:
+                return None
+            try:
+                fixes_by_file = _json_loads(obj)
+            except ValueError:
+                return None
+
+        if not isinstance(fixes_by_file, dict):
+            return None
+        return {
+            filename: self._validate_fixes(fixes)
+            for filename, fixes in fixes_by_file.items()
+            if isinstance(fixes, list)
+        }
+
     async def _analyze_pr_for_fixes(
         self,
         repo,
         pr,
         instruction: str,
+        files_by_name: dict,
         custom_instruction: str = None,
         comment_id: int = None,
         comment_type: str = "issue_comment",
     ):
         """Analyze entire PR for fixes when directly mentioned"""
         try:
-            files = list(pr.get_files())
-            fixes_created = 0
-
-            for file in files:
-                if file.patch and any(
-                    file.filename.endswith(ext)
-                    for ext in [".py", ".js", ".ts", ".java", ".cpp", ".go"]
-                ):
-                    synthetic_review = f"🤖 {file.filename}: {instruction}"
-                    fix_result = await self._create_suggested_fix(
-                        repo, pr, synthetic_review, custom_instruction
+            code_files = [
+                (filename, patch)
+                for filename, patch in files_by_name.items()
+                if patch and filename.endswith(_CODE_EXTS)
+            ]
+
+            # One Falcon call covers every file; fall back to per-file prompts
+            # when the batched response does not parse
+            fixes_by_file = await self._generate_fixes_for_pr(
+                code_files, instruction, custom_instruction
+            )
+            if fixes_by_file is not None:
+                fixes_created = 0
+                for filename, fixes in fixes_by_file.items():
+                    patch = files_by_name.get(filename)
+                    if not patch or not fixes:
+                        continue
+                    created = await self._gh_call(
+                        self._create_suggestions, pr, fixes, filename, patch
                     )
-                    if fix_result and "Created" in fix_result:
+                    if created > 0:
                         fixes_created += 1
+            else:
+                tasks = [
+                    self._create_suggested_fix(
+                        repo, pr, f"🤖 {filename}: {instruction}", files_by_name, custom_instruction
+                    )
+                    for filename, patch in code_files
+                ]
+                # One coroutine per file; the Falcon/GitHub semaphores bound fan-out
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+                fixes_created = sum(
+                    1
+                    for fix_result in results
+                    if isinstance(fix_result, str) and "Created" in fix_result
+                )
 
             return (
                 f"Analyzed PR: processed {fixes_created} files"
@@ -360,8 +758,26 @@ IMPORTANT:
         except Exception as e:
             return f"Error analyzing PR: {str(e)}"
 
+    def _cheap_should_fix(self, instruction: str) -> bool:
+        """Classify clear-cut instructions without an LLM round-trip
+
+        Returns True/False when the instruction is obviously a fix request or
+        obviously a question, or None when it is ambiguous and needs the AI.
+        """
+        question = "?" in instruction or bool(_QUESTION_START_RE.match(instruction))
+        fix = bool(_FIX_VERB_RE.search(instruction))
+        if question and not fix:
+            return False
+        if fix and not question:
+            return True
+        return None
+
     async def _should_provide_fix(self, instruction: str) -> bool:
         """Use AI to decide if instruction requires code fixes or just an answer"""
+        cheap = self._cheap_should_fix(instruction)
+        if cheap is not None:
+            return cheap
+
         prompt = f"""Analyze this user instruction carefully:
 
 Instruction: {instruction}
@@ -381,36 +797,45 @@ Examples:
 - "should I merge this?" -> ANSWER"""
         
         try:
-            response = self._call_falcon_ai(prompt)
+            response = await self._call_falcon_ai(prompt)
             return "FIX" in response.upper()
         except:
             return False  # Default to answer if AI fails
     
     async def _answer_question(self, pr, question: str, comment_id: int = None) -> str:
         """Answer a specific question about the PR with comment context"""
-        files_summary = ", ".join([f.filename for f in pr.get_files()][:5])
-        if len(list(pr.get_files())) > 5:
+        # Only the first five filenames end up in the prompt, so pull a
+        # single page instead of materializing every paginated result
+        files = await asyncio.to_thread(
+            lambda: list(itertools.islice(pr.get_files(), 6))
+        )
+        files_summary = ", ".join(f.filename for f in files[:5])
+        if len(files) > 5:
             files_summary += "..."
 
         # Get comment context if comment_id is provided
         comment_context = ""
         if comment_id:
-            print(f"DEBUG: Fetching context for comment_id: {comment_id}")
+            logger.debug("Fetching context for comment_id: %s", comment_id)
             try:
                 # Try to get the parent comment for context
                 repo_obj = pr.base.repo
-                comment = repo_obj.get_issue_comment(comment_id)
+                comment = await asyncio.to_thread(
+                    repo_obj.get_issue_comment, comment_id
+                )
                 comment_context = f"\n\nComment Context (user is asking about this comment):\n- Author: {comment.user.login}\n- Comment: {comment.body[:300]}"
-                print(f"DEBUG: Got issue comment context: {comment.body[:50]}...")
+                logger.debug("Got issue comment context: %.50s...", comment.body)
             except Exception as e:
-                print(f"DEBUG: Issue comment failed: {str(e)}")
+                logger.debug("Issue comment failed: %s", e)
                 try:
                     # Try as review comment
-                    comment = pr.get_review_comment(comment_id)
+                    comment = await asyncio.to_thread(
+                        pr.get_review_comment, comment_id
+                    )
                     comment_context = f"\n\nComment Context (user is asking about this review comment):\n- Author: {comment.user.login}\n- File: {comment.path}\n- Comment: {comment.body[:300]}"
-                    print(f"DEBUG: Got review comment context: {comment.body[:50]}...")
+                    logger.debug("Got review comment context: %.50s...", comment.body)
                 except Exception as e2:
-                    print(f"DEBUG: Review comment failed: {str(e2)}")
+                    logger.debug("Review comment failed: %s", e2)
                     comment_context = "\n\nNote: User is responding to a specific comment but context unavailable."
 
         prompt = f"""Answer this question about a GitHub PR:
@@ -424,9 +849,5 @@ PR Context:
 
 If the question is vague (like "why", "how", "what") and you have comment context, answer about that specific comment. If no context is available, ask for clarification about what specifically they want to know. Keep response conversational and helpful, 1-2 sentences max."""
 
-        return self._call_falcon_ai(prompt)
+        return await self._call_falcon_ai(prompt)
 
-    def _get_line_from_patch(self, patch: str) -> int:
-        """Extract line number from patch"""
-        match = re.search(r"@@\s*-\d+,?\d*\s*\+?(\d+)", patch)
-        return int(match.group(1)) if match else 1
@@ -1,21 +1,91 @@
 import os
+import re
+import gzip
+import json
+import asyncio
+import itertools
+import logging
 import requests
-from github import Github, Auth
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
+try:
+    from src.utils import falcon_cache
+    from src.utils.github_client import shared_github
+except ImportError:
+    # code_review_system puts src/ itself on sys.path
+    from utils import falcon_cache
+    from utils.github_client import shared_github
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "anthropic.claude-3-5-sonnet-20241022-v2:0"
+
+# Changed and hunk-header lines of a diff; context lines add tokens to the
+# summary prompt without adding information
+_PATCH_LINE_RE = re.compile(r"^[+\-@].*$", re.M)
+
+_REVIEWABLE_EXTS = frozenset(
+    {
+        "py", "js", "ts", "java", "cpp", "c", "go", "rs", "php", "rb",
+        "swift", "kt", "scala", "cs", "jsx", "tsx", "vue", "html", "css",
+        "scss", "sql", "sh", "yml", "yaml", "json", "xml",
+    }
+)
+
+
+_MIN_PATCH_BYTES = int(os.getenv("REVIEW_MIN_PATCH_BYTES", "200"))
+
+
+def _is_trivial_patch(patch: str) -> bool:
+    """True for changes too small to merit an LLM review"""
+    if len(patch) >= _MIN_PATCH_BYTES:
+        return False
+    added = sum(
+        1
+        for line in patch.splitlines()
+        if line.startswith("+") and not line.startswith("+++")
+    )
+    return added < 3
+
+
+def _compact_patch(patch: str) -> str:
+    """Strip a diff down to its hunk headers and changed lines"""
+    return "\n".join(_PATCH_LINE_RE.findall(patch))
+
 
 class ReviewBot:
     def __init__(self):
         load_dotenv()
-        auth = Auth.Token(os.getenv("GITHUB_TOKEN"))
-        self.github = Github(auth=auth)
+        # One client per process: shared connection pool and rate-limit view
+        self.github = shared_github()
         self.falcon_api_key = os.getenv("FALCON_API_KEY")
         self.base_url = "https://falconai.planview-prod.io"
-        self.model_name = None
-
-    def _get_best_model(self):
-        self.model_name = "anthropic.claude-3-5-sonnet-20241022-v2:0"
-        return self.model_name
+        # Persistent session keeps the TLS connection to Falcon alive across
+        # calls; transient 429/5xx responses are retried with backoff at the
+        # transport layer instead of surfacing as user-visible review errors
+        self._http = requests.Session()
+        self._http.headers.update(
+            {
+                "Authorization": f"Bearer {self.falcon_api_key}",
+                "Content-Type": "application/json",
+            }
+        )
+        self._http.mount(
+            "https://",
+            HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=16,
+                max_retries=Retry(
+                    total=3,
+                    backoff_factor=1.0,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                    allowed_methods=["POST"],
+                    respect_retry_after_header=True,
+                ),
+            ),
+        )
 
     async def review_pr(
         self,
@@ -27,15 +97,17 @@ class ReviewBot:
     ):
         """Review a specific PR with optional custom instruction"""
         try:
-            repo = self.github.get_repo(repo_name)
-            pr = repo.get_pull(pr_number)
+            # Blocking PyGithub calls run in worker threads so the event loop
+            # stays free while GitHub round-trips are in flight
+            repo = self.github.get_repo(repo_name, lazy=True)
+            pr = await asyncio.to_thread(repo.get_pull, pr_number)
 
             # If there's a custom instruction and comment_id, respond directly to the question
             if custom_instruction and comment_id:
                 response = await self._answer_question(pr, custom_instruction, comment_id)
-                self._post_comment(
-                    repo_name,
-                    pr_number,
+                await asyncio.to_thread(
+                    self._post_comment,
+                    pr,
                     f"🤖 **ReviewBot:**\n{response}",
                     comment_id,
                     comment_type,
@@ -43,80 +115,195 @@ class ReviewBot:
                 return [f"Direct response: {response}"]
 
             # Otherwise, do full PR analysis
-            changes = list(pr.get_files())
+            changes = await asyncio.to_thread(lambda: list(pr.get_files()))
             review_comments = []
 
-            reviewable_extensions = [
-                ".py",
-                ".js",
-                ".ts",
-                ".java",
-                ".cpp",
-                ".c",
-                ".go",
-                ".rs",
-                ".php",
-                ".rb",
-                ".swift",
-                ".kt",
-                ".scala",
-                ".cs",
-                ".jsx",
-                ".tsx",
-                ".vue",
-                ".html",
-                ".css",
-                ".scss",
-                ".sql",
-                ".sh",
-                ".yml",
-                ".yaml",
-                ".json",
-                ".xml",
-            ]
             reviewable_files = [
                 f
                 for f in changes
-                if any(f.filename.endswith(ext) for ext in reviewable_extensions)
+                if f.filename.rpartition(".")[2].lower() in _REVIEWABLE_EXTS
             ]
 
-            all_changes = ""
-            for file in changes:
-                if file.patch:
-                    all_changes += f"\n--- {file.filename} ---\n{file.patch}\n"
+            # Docs-only PRs skip the summary entirely — no point burning a
+            # Falcon call on a PR with nothing to review
+            if not reviewable_files:
+                no_files_text = "✅ **ReviewBot - No code files to review!**\n\nThis PR doesn't contain code changes that need review."
+                await asyncio.to_thread(
+                    self._post_comment, pr, no_files_text, comment_id, comment_type
+                )
+                return ["No reviewable files found for review"]
+
+            # _get_ai_summary only keeps the first 1000 chars, so stop
+            # collecting patches once the budget is spent instead of
+            # concatenating every diff and throwing most of it away
+            summary_parts = []
+            summary_total = 0
+            for file in reviewable_files:
+                if not file.patch:
+                    continue
+                compact = _compact_patch(file.patch)
+                part = f"\n--- {file.filename} ---\n{compact[: 1000 - summary_total]}\n"
+                summary_parts.append(part)
+                summary_total += len(part)
+                if summary_total >= 1000:
+                    break
+            all_changes = "".join(summary_parts)
+
+            # The summary and the per-file reviews are independent Falcon
+            # calls, so run the summary concurrently with the review batch
+            summary_task = asyncio.create_task(
+                asyncio.to_thread(
+                    self._get_ai_summary,
+                    pr.title,
+                    pr.body or "No description",
+                    all_changes,
+                )
+            )
 
-            ai_summary = self._get_ai_summary(
-                pr.title, pr.body or "No description", all_changes
+            # Batch several diffs per Falcon call, then fill any gaps with
+            # concurrent per-file calls (each in a worker thread so the
+            # blocking HTTP call doesn't hold the loop)
+            # Version bumps, typo fixes and the like get a deterministic
+            # note instead of a boilerplate Falcon review
+            trivial_files = []
+            files_to_review = []
+            for file in reviewable_files:
+                if not file.patch:
+                    continue
+                if _is_trivial_patch(file.patch):
+                    trivial_files.append(file)
+                else:
+                    files_to_review.append(file)
+            # Identical patches (the same mechanical change applied across
+            # many files) get one Falcon review, reused for the duplicates
+            first_for_patch = {}
+            duplicates = {}
+            unique_files = []
+            for file in files_to_review:
+                original = first_for_patch.setdefault(file.patch, file.filename)
+                if original == file.filename:
+                    unique_files.append(file)
+                else:
+                    duplicates[file.filename] = original
+            reviews_by_file = await asyncio.to_thread(
+                self._get_ai_review_batch, unique_files, custom_instruction
+            )
+            missing = [f for f in unique_files if f.filename not in reviews_by_file]
+            ai_reviews = await asyncio.gather(
+                *[
+                    asyncio.to_thread(
+                        self._get_ai_review, file.filename, file.patch, custom_instruction
+                    )
+                    for file in missing
+                ]
             )
+            reviews_by_file.update(
+                {file.filename: review for file, review in zip(missing, ai_reviews)}
+            )
+            for filename, original in duplicates.items():
+                reviews_by_file[filename] = (
+                    f"{reviews_by_file[original]}\n\n_(Same change as {original}.)_"
+                )
+
+            ai_summary = await summary_task
             summary_text = f"🤖 **AI Summary:**\n{ai_summary}"
-            self._post_comment(
-                repo_name, pr_number, summary_text, comment_id, comment_type
+            await asyncio.to_thread(
+                self._post_comment, pr, summary_text, comment_id, comment_type
             )
             review_comments.append(f"🤖 AI Summary:\n{ai_summary}")
 
-            for file in reviewable_files:
-                if file.patch:
-                    ai_review = self._get_ai_review(
-                        file.filename, file.patch, custom_instruction
-                    )
-                    review_text = f"🤖 **AI Review for {file.filename}:**\n{ai_review}"
-                    self._post_comment(
-                        repo_name, pr_number, review_text, comment_id, comment_type
-                    )
-                    review_comments.append(f"🤖 {file.filename}:\n{ai_review}")
+            sections = []
+            for file in files_to_review:
+                ai_review = reviews_by_file[file.filename]
+                sections.append(f"### {file.filename}\n{ai_review}")
+                review_comments.append(f"🤖 {file.filename}:\n{ai_review}")
+            # Trivial files appear in the posted comment only: the returned
+            # list feeds FixBot, and a "🤖 file:" entry would send it hunting
+            # for fixes in the placeholder text of exactly the files we
+            # skipped to save calls on
+            for file in trivial_files:
+                sections.append(
+                    f"### {file.filename}\n✅ Trivial change — skipped AI review"
+                )
 
-            if not reviewable_files:
-                no_files_text = "✅ **ReviewBot - No code files to review!**\n\nThis PR doesn't contain code changes that need review."
-                self._post_comment(
-                    repo_name, pr_number, no_files_text, comment_id, comment_type
+            if os.getenv("REVIEW_VERBOSE") == "1":
+                # One comment per file, mainly for debugging
+                await asyncio.gather(
+                    *[
+                        asyncio.to_thread(
+                            self._post_comment, pr, section, comment_id, comment_type
+                        )
+                        for section in sections
+                    ]
+                )
+            elif sections:
+                review_text = "🤖 **AI Review:**\n\n" + "\n\n".join(sections)
+                await asyncio.to_thread(
+                    self._post_comment, pr, review_text, comment_id, comment_type
                 )
-                review_comments.append("No reviewable files found for review")
 
             return review_comments
 
         except Exception as e:
             return [f"Error reviewing PR: {str(e)}"]
 
+    def _get_ai_review_batch(
+        self, files: list, custom_instruction: str = None
+    ) -> dict:
+        """Review several files per Falcon call, returned as {filename: review}
+
+        Files are grouped into ~8K-char chunks so one request amortizes the
+        per-call overhead across many small diffs. Files whose review cannot
+        be parsed are simply absent; callers fall back to per-file calls.
+        """
+        chunks = []
+        chunk, size = [], 0
+        for file in files:
+            if chunk and size + len(file.patch) > 8000:
+                chunks.append(chunk)
+                chunk, size = [], 0
+            chunk.append(file)
+            size += len(file.patch)
+        if chunk:
+            chunks.append(chunk)
+
+        reviews = {}
+        for chunk in chunks:
+            sections = "\n".join(
+                f"--- {file.filename} ---\n{file.patch}" for file in chunk
+            )
+            prompt = f"""Review ONLY the changed lines in these code diffs:
+
+{sections}
+
+For each file provide a brief review (issues in the changed lines and quick
+suggestions, under 3 sentences). Respond with ONLY a valid JSON array:
+[{{"file": "path/to/file.py", "review": "..."}}]"""
+
+            if custom_instruction:
+                prompt += f"\n\nAdditional instruction: {custom_instruction}"
+
+            # Batched replies carry one review per file, so they need more
+            # output room than a single-file call
+            response = self._call_falcon_ai(prompt, max_tokens=150 * len(chunk))
+            json_str = response.strip()
+            try:
+                entries = json.loads(json_str)
+            except ValueError:
+                start, end = json_str.find("["), json_str.rfind("]")
+                if start < 0 or end <= start:
+                    continue
+                try:
+                    entries = json.loads(json_str[start : end + 1])
+                except ValueError:
+                    continue
+
+            if isinstance(entries, list):
+                for entry in entries:
+                    if isinstance(entry, dict) and entry.get("file") and entry.get("review"):
+                        reviews[entry["file"]] = str(entry["review"])
+        return reviews
+
     def _get_ai_review(
         self, filename: str, patch: str, custom_instruction: str = None
     ) -> str:
@@ -151,41 +338,93 @@ Code Changes:
 {changes[:1000]}
 
 What does this PR do and any major concerns?"""
-        return self._call_falcon_ai(prompt)
+        return self._call_falcon_ai(prompt, max_tokens=300)
 
-    def _call_falcon_ai(self, prompt: str) -> str:
+    def _call_falcon_ai(self, prompt: str, max_tokens: int = 200) -> str:
         """Make API call to Falcon AI using the best available model"""
+        cached = falcon_cache.get(MODEL_NAME, prompt)
+        if cached is not None:
+            return cached
+
         try:
             url = f"{self.base_url}/api/chat/completions"
-            headers = {
-                "Authorization": f"Bearer {self.falcon_api_key}",
-                "Content-Type": "application/json",
+            logger.debug("Calling Falcon model %s", MODEL_NAME)
+            data = {
+                "model": MODEL_NAME,
+                "stream": True,
+                "max_tokens": max_tokens,
+                "messages": [{"role": "user", "content": prompt}],
             }
-            model = self._get_best_model()
-            print(model)
-            data = {"model": model, "messages": [{"role": "user", "content": prompt}]}
 
-            # Try with longer timeout for AI processing
-            response = requests.post(url, headers=headers, json=data, timeout=90)
+            # Compress large bodies (big patches) on the wire; below ~1 KB
+            # the gzip framing costs more than it saves
+            body = json.dumps(data).encode()
+            headers = {}
+            if len(body) > 1024:
+                body = gzip.compress(body)
+                headers["Content-Encoding"] = "gzip"
+
+            # Stream so tokens are consumed as they arrive instead of
+            # blocking until Falcon emits the final one
+            response = self._http.post(
+                url, data=body, headers=headers, timeout=90, stream=True
+            )
 
-            if response.status_code == 200:
-                result = response.json()
-                if "choices" in result and len(result["choices"]) > 0:
-                    return result["choices"][0]["message"]["content"].strip()
-                else:
-                    return f"Unexpected response format: {str(result)[:300]}"
-            else:
+            if response.status_code != 200:
                 print(f"Chat API error: {response.status_code} - {response.text}")
                 return f"API error {response.status_code}: {response.text[:200]}"
 
+            if "text/event-stream" not in response.headers.get("Content-Type", ""):
+                # Endpoint ignored stream=True; fall back to the buffered body
+                result = response.json()
+                if "choices" in result and len(result["choices"]) > 0:
+                    content = result["choices"][0]["message"]["content"].strip()
+                    falcon_cache.put(MODEL_NAME, prompt, content)
+                    return content
+                return f"Unexpected response format: {str(result)[:300]}"
+
+            # Guard against runaway generations: stop reading once the
+            # stream is well past what max_tokens should allow
+            char_budget = max_tokens * 8
+            parts = []
+            received = 0
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                try:
+                    event = json.loads(payload)
+                except ValueError:
+                    continue
+                choices = event.get("choices")
+                if choices:
+                    piece = choices[0].get("delta", {}).get("content") or ""
+                    parts.append(piece)
+                    received += len(piece)
+                    if received > char_budget:
+                        break
+            content = "".join(parts).strip()
+            if not content:
+                # Don't cache an empty stream — a poisoned entry would
+                # silently blank this prompt's review forever
+                return "API error: empty streamed response"
+            falcon_cache.put(MODEL_NAME, prompt, content)
+            return content
+
         except Exception as e:
             return f"Falcon AI call failed: {str(e)}"
 
     async def _answer_question(self, pr, question: str, comment_id: int = None) -> str:
         """Answer a specific question about the PR with comment context"""
-        # Get basic PR context
-        files_summary = ", ".join([f.filename for f in pr.get_files()][:5])
-        if len(list(pr.get_files())) > 5:
+        # Get basic PR context; only the first five filenames end up in the
+        # prompt, so pull a single page instead of every paginated result
+        files = await asyncio.to_thread(
+            lambda: list(itertools.islice(pr.get_files(), 6))
+        )
+        files_summary = ", ".join(f.filename for f in files[:5])
+        if len(files) > 5:
             files_summary += "..."
 
         # Get comment context if comment_id is provided
@@ -194,12 +433,12 @@ What does this PR do and any major concerns?"""
             try:
                 # Try to get the parent comment for context
                 repo = pr.base.repo
-                comment = repo.get_issue_comment(comment_id)
+                comment = await asyncio.to_thread(repo.get_issue_comment, comment_id)
                 comment_context = f"\n\nComment Context (user is asking about this comment):\n- Author: {comment.user.login}\n- Comment: {comment.body[:300]}..."
             except:
                 try:
                     # Try as review comment
-                    comment = pr.get_review_comment(comment_id)
+                    comment = await asyncio.to_thread(pr.get_review_comment, comment_id)
                     comment_context = f"\n\nComment Context (user is asking about this review comment):\n- Author: {comment.user.login}\n- File: {comment.path}\n- Comment: {comment.body[:300]}..."
                 except:
                     comment_context = "\n\nNote: User is responding to a specific comment but context unavailable."
@@ -219,17 +458,13 @@ Provide a direct, helpful answer that considers the comment context if available
 
     def _post_comment(
         self,
-        repo_name: str,
-        pr_number: int,
+        pr,
         text: str,
         comment_id: int = None,
         comment_type: str = "issue_comment",
     ):
         """Post comment as reply or new comment based on type"""
         try:
-            repo = self.github.get_repo(repo_name)
-            pr = repo.get_pull(pr_number)
-
             if comment_id and comment_type == "review_comment":
                 try:
                     pr.create_review_comment_reply(comment_id, text)
@@ -0,0 +1,86 @@
+"""
+Falcon AI response cache
+
+Content-addressed cache shared by ReviewBot and FixBot: an in-memory dict in
+front of one file per sha256(model + prompt) on disk. Re-reviews and Action
+reruns resend identical prompts, and a hit skips the Falcon round-trip (and
+its token cost) entirely.
+"""
+
+import os
+import re
+import hashlib
+import logging
+import threading
+import collections
+
+logger = logging.getLogger(__name__)
+
+# Cache keys are computed on a normalized prompt so cosmetic diff noise —
+# shifted hunk line numbers after a rebase, trailing whitespace — still hits
+# the entry cached for the equivalent prompt
+_HUNK_NUMS_RE = re.compile(r"@@ -\d+(?:,\d+)? \+\d+(?:,\d+)? @@")
+_TRAILING_WS_RE = re.compile(r"[ \t]+$", re.M)
+
+CACHE_DIR = os.getenv(
+    "FALCON_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "let_them_review"),
+)
+
+# In-memory tier in front of the disk files, LRU-bounded so a long-lived
+# process reviewing many PRs can't grow it without limit. Both bots reach
+# this from to_thread workers, so all OrderedDict mutation happens under
+# the lock
+_MEMORY_MAX = 1024
+_memory = collections.OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def _normalize(prompt: str) -> str:
+    """Canonical form of a prompt for key purposes only"""
+    return _TRAILING_WS_RE.sub("", _HUNK_NUMS_RE.sub("@@ @@", prompt))
+
+
+def _cache_path(model: str, prompt: str) -> str:
+    """Content-addressed cache file for a model + prompt pair"""
+    key = hashlib.sha256((model + _normalize(prompt)).encode()).hexdigest()
+    return os.path.join(CACHE_DIR, f"{key}.txt")
+
+
+def get(model: str, prompt: str) -> str:
+    """Return the cached response, or None on a miss"""
+    memory_key = (model, _normalize(prompt))
+    with _memory_lock:
+        if memory_key in _memory:
+            _memory.move_to_end(memory_key)
+            return _memory[memory_key]
+    try:
+        path = _cache_path(model, prompt)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                response = f.read()
+            _remember(memory_key, response)
+            return response
+    except Exception as e:
+        logger.debug("Cache read failed: %s", e)
+    return None
+
+
+def _remember(memory_key, response: str):
+    """Insert into the in-memory tier, evicting the least recently used"""
+    with _memory_lock:
+        _memory[memory_key] = response
+        _memory.move_to_end(memory_key)
+        while len(_memory) > _MEMORY_MAX:
+            _memory.popitem(last=False)
+
+
+def put(model: str, prompt: str, response: str):
+    """Store a successful response in memory and on disk"""
+    _remember((model, _normalize(prompt)), response)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(_cache_path(model, prompt), "w", encoding="utf-8") as f:
+            f.write(response)
+    except Exception as e:
+        logger.debug("Cache write failed: %s", e)
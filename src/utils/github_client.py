@@ -1,14 +1,34 @@
 import os
-from github import Github
+from github import Github, Auth
 from dotenv import load_dotenv
 
 load_dotenv()
 
+_shared_client = None
+
+
+def shared_github(token=None) -> Github:
+    """Process-wide Github client for the default token
+
+    Sharing one client means one urllib3 connection pool to
+    api.github.com and one view of the rate-limit budget across
+    ReviewBot, FixBot and GitHubClient. Passing an explicit token
+    returns a dedicated client instead.
+    """
+    global _shared_client
+    if token:
+        return Github(auth=Auth.Token(token), per_page=100)
+    if _shared_client is None:
+        _shared_client = Github(
+            auth=Auth.Token(os.getenv("GITHUB_TOKEN")), per_page=100
+        )
+    return _shared_client
+
 
 class GitHubClient:
     def __init__(self, token=None):
         self.token = token or os.getenv("GITHUB_TOKEN")
-        self.client = Github(self.token)
+        self.client = shared_github(token)
 
     def get_pr(self, repo_name, pr_number):
         repo = self.client.get_repo(repo_name)